@@ -1,11 +1,12 @@
 from pathlib import Path
+import asyncio
+import hashlib
+import mmap
 import os
+import sqlite3
 from dotenv import load_dotenv
 
-import markdown
-from bs4 import BeautifulSoup
-
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.text_splitter import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 from langchain_google_genai import ChatGoogleGenerativeAI
 import chromadb
 
@@ -17,6 +18,13 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in .env")
 
+# Maximum number of summary requests in flight at once
+MAX_CONCURRENT_SUMMARIES = 8
+# SQLite file caching summaries by content hash, so unchanged files skip the LLM
+SUMMARY_CACHE_PATH = "../summary_cache.sqlite"
+# Number of chunks sent to Chroma per collection.add call
+ADD_BATCH_SIZE = 1000
+
 # -------------------
 # Initialize Gemini LLM
 # -------------------
@@ -32,28 +40,28 @@ llm = ChatGoogleGenerativeAI(
 # -------------------
 # Utility Functions
 # -------------------
-def clean_text(text: str) -> str:
-    """
-    Remove everything after the 'images={' substring in the text.
-    """
-    split_token = "images={"
-    if split_token in text:
-        return text.split(split_token)[0]
-    return text
-
-
-def markdown_to_text(md: str) -> str:
+def read_clean_markdown(file_path: Path) -> str:
     """
-    Convert Markdown content to plain text.
+    Read a Markdown file, dropping everything after the 'images={' substring.
+    The file is memory-mapped and only the kept part is decoded, so the full
+    raw text is never held in memory alongside the cleaned text.
     """
-    html = markdown.markdown(md)
-    soup = BeautifulSoup(html, features="html.parser")
-    return soup.get_text(separator="\n")
-
-
-def generate_summary(text: str) -> str:
+    split_token = b"images={"
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.find(split_token)
+            if end == -1:
+                end = len(mm)
+            with memoryview(mm) as view:
+                return str(view[:end], encoding="utf-8")
+
+
+async def agenerate_summary(text: str, semaphore: asyncio.Semaphore) -> str:
     """
     Generate a concise high-level summary for a document using the Gemini LLM.
+    The semaphore caps how many requests are sent concurrently.
     """
     messages = [
         (
@@ -73,50 +81,129 @@ def generate_summary(text: str) -> str:
         ("human", f"Please summarize the following text: {text}"),
     ]
 
-    response = llm.invoke(messages)
+    async with semaphore:
+        response = await llm.ainvoke(messages)
     return response.content if response.content else ""
 
 
+def open_summary_cache(path: str) -> sqlite3.Connection:
+    """
+    Open (and create if needed) the SQLite summary cache.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS summaries (hash TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+    return conn
+
+
+def content_hash(text: str) -> str:
+    """
+    Return the SHA-256 hex digest of the text, used as the summary cache key.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def agenerate_summaries(texts: list[str], cache: sqlite3.Connection) -> list[str]:
+    """
+    Generate summaries for all documents, preserving input order.
+    Cached summaries are reused; only cache misses are sent to the LLM, concurrently.
+    """
+    hashes = [content_hash(text) for text in texts]
+    summaries = {}
+    for h in set(hashes):
+        row = cache.execute("SELECT summary FROM summaries WHERE hash = ?", (h,)).fetchone()
+        if row:
+            summaries[h] = row[0]
+
+    misses = {h: text for h, text in zip(hashes, texts) if h not in summaries}
+    print(f"  {len(texts) - len(misses)} summaries cached, {len(misses)} to generate.")
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+
+    async def summarize_and_cache(h: str, text: str) -> str:
+        # Cache each summary as soon as it arrives, so a later failure does not discard it
+        summary = await agenerate_summary(text, semaphore)
+        if summary:
+            cache.execute("INSERT OR REPLACE INTO summaries (hash, summary) VALUES (?, ?)", (h, summary))
+            cache.commit()
+        return summary
+
+    generated = await asyncio.gather(
+        *(summarize_and_cache(h, text) for h, text in misses.items()),
+        return_exceptions=True
+    )
+
+    # Re-raise the first failure only after all other summaries have finished and been cached
+    for result in generated:
+        if isinstance(result, BaseException):
+            raise result
+
+    summaries.update(zip(misses, generated))
+    return [summaries[h] for h in hashes]
+
+
 # -------------------
 # Main Processing
 # -------------------
 def main():
     input_dir = Path("../docs/markdown")
+    # Split on section headings first, then split long sections by characters
+    header_splitter = MarkdownHeaderTextSplitter(
+        headers_to_split_on=[("#", "h1"), ("##", "h2"), ("###", "h3")],
+        strip_headers=False
+    )
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=100,
-        separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+        # MarkdownHeaderTextSplitter rewrites paragraph breaks as "  \n"
+        separators=["\n\n", "  \n", "\n", ".", "!", "?", ",", " ", ""]
     )
 
     # Initialize Chroma client and collection
     client = chromadb.PersistentClient(path="../")
     collection = client.get_or_create_collection(name="un_population_report_2024")
 
-    total_docs_added = 0
-
+    # Read and clean all documents up front so summaries can be requested together
+    items = []
     for file_path in input_dir.glob("*.md"):
-        print(f"\nProcessing {file_path.name}...")
+        items.append((file_path, read_clean_markdown(file_path)))
 
-        raw_text = file_path.read_text(encoding="utf-8")
-        cleaned_text = clean_text(raw_text)
-        plain_text = markdown_to_text(cleaned_text)
+    # Generate summaries for context
+    print(f"Generating summaries for {len(items)} documents...")
+    summary_cache = open_summary_cache(SUMMARY_CACHE_PATH)
+    try:
+        summaries = asyncio.run(agenerate_summaries([text for _, text in items], summary_cache))
+    finally:
+        summary_cache.close()
 
-        # Generate summary for context
-        summary = generate_summary(plain_text)
+    # Accumulate chunks from all files so they can be added in large batches
+    all_documents, all_metadatas, all_ids = [], [], []
 
-        # Split text into chunks
-        chunks = splitter.split_text(plain_text)
-
-        # Prepare documents for Chroma
-        documents = [f"{summary}\n\n{chunk}" for chunk in chunks]
-        metadatas = [{"source": file_path.name, "chunk_index": i} for i in range(len(chunks))]
-        ids = [f"{file_path.stem}_chunk_{i}" for i in range(len(chunks))]
-
-        # Add chunks to collection
-        collection.add(documents=documents, metadatas=metadatas, ids=ids)
-        total_docs_added += len(chunks)
+    for (file_path, text), summary in zip(items, summaries):
+        print(f"\nProcessing {file_path.name}...")
 
-        print(f"  Added {len(chunks)} chunks from {file_path.name}.")
+        # Split markdown into sections, then sections into chunks
+        sections = header_splitter.split_text(text)
+        chunks = splitter.split_documents(sections)
+
+        # Prepare documents for Chroma in a single pass, keeping section headings as metadata
+        stem, name, prefix = file_path.stem, file_path.name, f"{summary}\n\n"
+        for i, chunk in enumerate(chunks):
+            all_documents.append(prefix + chunk.page_content)
+            all_metadatas.append({"source": name, "chunk_index": i, **chunk.metadata})
+            all_ids.append(f"{stem}_chunk_{i}")
+
+        print(f"  Prepared {len(chunks)} chunks from {file_path.name}.")
+
+    # Add chunks to collection, respecting Chroma's maximum batch size
+    batch_size = min(ADD_BATCH_SIZE, client.get_max_batch_size())
+    for start in range(0, len(all_documents), batch_size):
+        end = start + batch_size
+        collection.add(
+            documents=all_documents[start:end],
+            metadatas=all_metadatas[start:end],
+            ids=all_ids[start:end]
+        )
+        print(f"  Added chunks {start + 1}-{min(end, len(all_documents))} of {len(all_documents)}.")
 
     # Print summary
     total_docs_in_collection = collection.count()
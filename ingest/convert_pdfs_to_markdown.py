@@ -1,11 +1,26 @@
+import hashlib
+import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
 
+import torch
 from marker.converters.pdf import PdfConverter
 from marker.models import create_model_dict
 from marker.config.parser import ConfigParser
 
+# -------------------
+# Configuration
+# -------------------
+# Marker's PDF backend (pypdfium2) is not thread-safe, so PDFs are converted in
+# separate processes, each with its own converter. Every worker loads the full
+# set of models, so the number of workers is kept small.
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Sidecar file (in the output directory) mapping PDF names to their content hash
+MANIFEST_NAME = "manifest.json"
+
 
 # -------------------
 # Utility Functions
@@ -29,6 +44,33 @@ def prepare_output_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+def file_sha256(path: Path) -> str:
+    """
+    Return the SHA-256 hex digest of a file, read in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path: Path) -> dict:
+    """
+    Load the conversion manifest, or return an empty one if it does not exist.
+    """
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(path: Path, manifest: dict) -> None:
+    """
+    Write the conversion manifest to disk.
+    """
+    path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+
 def create_pdf_converter(gemini_api_key: str) -> PdfConverter:
     """
     Initialize and return a PdfConverter instance with Marker configuration.
@@ -55,6 +97,39 @@ def create_pdf_converter(gemini_api_key: str) -> PdfConverter:
     return converter
 
 
+# Converter of the current worker process, set by init_worker
+worker_converter = None
+
+
+def init_worker(gemini_api_key: str, torch_threads: int) -> None:
+    """
+    Initialize a worker process: limit its torch threads so workers do not
+    oversubscribe the CPU, and build the converter it reuses for every PDF.
+    """
+    global worker_converter
+    torch.set_num_threads(torch_threads)
+    worker_converter = create_pdf_converter(gemini_api_key)
+
+
+def convert_pdf(pdf_path: Path, output_dir: Path) -> Path:
+    """
+    Convert a single PDF to Markdown in a worker process and write it to
+    the output directory. Returns the path of the written Markdown file.
+    """
+    rendered = worker_converter(str(pdf_path))  # returns rendered markdown as string
+
+    # Convert rendered object to string if necessary
+    if hasattr(rendered, "as_string"):
+        md_text = rendered.as_string()
+    else:
+        md_text = str(rendered)
+
+    # Save markdown output
+    output_file = output_dir / f"{pdf_path.stem}.md"
+    output_file.write_text(md_text, encoding="utf-8")
+    return output_file
+
+
 # -------------------
 # Main Processing
 # -------------------
@@ -63,29 +138,51 @@ def main():
     output_dir = Path("../docs/markdown/")
     prepare_output_dir(output_dir)
 
-    gemini_api_key = load_gemini_api_key()
-    converter = create_pdf_converter(gemini_api_key)
-
     pdf_files = list(input_dir.glob("*.pdf"))
     if not pdf_files:
         print("No PDF files found in the input directory.")
         return
 
+    # Skip PDFs whose content is unchanged since their markdown was written
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    pending = []
     for pdf_path in pdf_files:
-        print(f"Processing: {pdf_path.name}")
-
-        rendered = converter(str(pdf_path))  # returns rendered markdown as string
+        pdf_hash = file_sha256(pdf_path)
+        output_file = output_dir / f"{pdf_path.stem}.md"
+        if manifest.get(pdf_path.name, {}).get("hash") == pdf_hash and output_file.exists():
+            print(f"Skipping unchanged: {pdf_path.name}")
+            continue
+        pending.append((pdf_path, pdf_hash))
 
-        # Convert rendered object to string if necessary
-        if hasattr(rendered, "as_string"):
-            md_text = rendered.as_string()
-        else:
-            md_text = str(rendered)
+    if not pending:
+        print("All PDFs are up to date.")
+        return
 
-        # Save markdown output
-        output_file = output_dir / f"{pdf_path.stem}.md"
-        output_file.write_text(md_text, encoding="utf-8")
-        print(f"Saved to {output_file}")
+    gemini_api_key = load_gemini_api_key()
+    workers = min(MAX_WORKERS, len(pending))
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    # "spawn" start method, as forked processes cannot use CUDA
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(gemini_api_key, torch_threads)
+    ) as executor:
+        futures = {}
+        for pdf_path, pdf_hash in pending:
+            print(f"Processing: {pdf_path.name}")
+            futures[executor.submit(convert_pdf, pdf_path, output_dir)] = (pdf_path, pdf_hash)
+
+        for future in as_completed(futures):
+            output_file = future.result()
+            print(f"Saved to {output_file}")
+
+            # Record the hash as soon as each file is done, so partial runs are kept
+            pdf_path, pdf_hash = futures[future]
+            manifest[pdf_path.name] = {"hash": pdf_hash, "output": output_file.name}
+            save_manifest(manifest_path, manifest)
 
     print("All PDFs processed successfully.")
 
@@ -1,4 +1,6 @@
 # main.py
+import asyncio
+
 from retrieval.main_workflow import main_rag_app
 from query_gemini import query_ai
 from prompt_templates import prompt_templates
@@ -12,12 +14,16 @@ questions_text = query_ai(prompt_templates["generate_questions_prompt"]["system"
 questions = [q.strip("12345. ").strip() for q in questions_text.split("\n") if q.strip()]
 
 # -------------------
-# Step 2: Pass each question to main_rag_app and print nicely
+# Step 2: Pass all questions to main_rag_app concurrently and print nicely
 # -------------------
 print("\n=== Running RAG Workflow on Generated Questions ===\n")
 
-for idx, question in enumerate(questions, start=1):
-    result = main_rag_app.invoke({"query": question})
+results = asyncio.run(main_rag_app.abatch(
+    [{"query": question} for question in questions],
+    config={"max_concurrency": len(questions)}
+))
+
+for idx, (question, result) in enumerate(zip(questions, results), start=1):
     answer = result.get("answer", "[No answer returned]")
 
     print(f"Q{idx}: {question}")
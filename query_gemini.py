@@ -4,6 +4,7 @@ Utility to send prompts to Google Gemini via LangChain.
 
 Functions:
 - query_ai(system_prompt, user_prompt) → str
+- aquery_ai(system_prompt, user_prompt) → str (async)
 """
 
 from pathlib import Path
@@ -55,3 +56,27 @@ def query_ai(system_prompt: str, user_prompt: str) -> str:
     )
 
     return response.content.strip() if response.content else ""
+
+
+async def aquery_ai(system_prompt: str, user_prompt: str) -> str:
+    """
+    Async version of `query_ai`, so multiple queries can run concurrently.
+
+    Args:
+        system_prompt (str): The system-level instructions for the model.
+        user_prompt (str): The user’s question or request.
+
+    Returns:
+        str: The model's response (cleaned), or empty string if no content.
+    """
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=user_prompt)
+    ]
+
+    response = await chat.ainvoke(
+        input=messages,
+        config={"temperature": 0.7}
+    )
+
+    return response.content.strip() if response.content else ""
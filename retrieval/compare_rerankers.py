@@ -0,0 +1,86 @@
+"""
+compare_rerankers.py
+--------------------
+Checks whether the reduced-precision CPU rerankers pick the same top
+documents as the FP32 CrossEncoder, before enabling them by default.
+
+For each query, the candidates are built exactly as in the retrieval
+sub-graph (semantic + BM25 search, deduplicated). They are scored with
+FP32, BF16 and INT8 ONNX Runtime, and the top NR_FINAL_DOCS are compared.
+
+Run from the project root:
+    python -m retrieval.compare_rerankers
+"""
+
+import torch
+from sentence_transformers import CrossEncoder
+
+from .retrieval_workflow import (
+    NR_FINAL_DOCS,
+    RERANKER_MODEL,
+    bm25_search_node,
+    deduplicate_docs,
+    load_quantized_reranker,
+    predict_scores,
+    semantic_search_node,
+)
+
+# Representative in-scope questions about the World Population Prospects 2024
+QUERIES = [
+    "What is the projected world population in 2050?",
+    "When is the world population expected to peak?",
+    "What is the current total fertility rate worldwide?",
+    "How has life expectancy at birth changed since 1995?",
+    "Which countries have already reached their peak population?",
+    "How does the UN estimate international migration?",
+    "What data sources are used to estimate fertility in countries without vital registration?",
+    "How did the COVID-19 pandemic affect mortality estimates?",
+    "What is the population growth outlook for sub-Saharan Africa?",
+    "How many people will be aged 80 or over by the late 2070s?",
+    "What methodology is used for probabilistic population projections?",
+    "How is adolescent fertility changing?",
+]
+
+
+def top_k(query: str, doc_texts: list[str], model, tokenizer) -> list[int]:
+    """
+    Return the indices of the top NR_FINAL_DOCS documents, best first.
+    """
+    scores = predict_scores(query, doc_texts, model=model, tokenizer=tokenizer)
+    return scores.argsort()[::-1][:NR_FINAL_DOCS].tolist()
+
+
+def main():
+    fp32 = CrossEncoder(RERANKER_MODEL, device="cpu")
+    bf16 = CrossEncoder(RERANKER_MODEL, device="cpu", automodel_args={"torch_dtype": torch.bfloat16})
+    int8_model, int8_tokenizer = load_quantized_reranker()
+    candidates = {
+        "bf16": (bf16.model, bf16.tokenizer),
+        "int8": (int8_model, int8_tokenizer),
+    }
+
+    same_set = {name: 0 for name in candidates}
+    same_order = {name: 0 for name in candidates}
+
+    for query in QUERIES:
+        state = {"query": query}
+        docs = deduplicate_docs(
+            semantic_search_node(state)["semantic_docs"] + bm25_search_node(state)["bm25_docs"]
+        )
+        doc_texts = [doc.page_content for doc in docs]
+        reference = top_k(query, doc_texts, fp32.model, fp32.tokenizer)
+
+        print(f"\n{query}\n  fp32: {reference}")
+        for name, (model, tokenizer) in candidates.items():
+            result = top_k(query, doc_texts, model, tokenizer)
+            same_set[name] += set(result) == set(reference)
+            same_order[name] += result == reference
+            print(f"  {name}: {result}  overlap {len(set(result) & set(reference))}/{len(reference)}")
+
+    print(f"\n=== Top-{NR_FINAL_DOCS} agreement with FP32 over {len(QUERIES)} queries ===")
+    for name in candidates:
+        print(f"{name}: same documents {same_set[name]}/{len(QUERIES)}, same order {same_order[name]}/{len(QUERIES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+evaluate_triage.py
+------------------
+Measures how often the local embedding triage agrees with the Gemini
+triage, to choose TRIAGE_MIN_MARGIN in main_workflow.py.
+
+Each labelled question is classified by both. For a range of margins, the
+report shows how many queries the local classifier would decide on its own,
+how often those decisions agree with Gemini, and how often they match the
+hand-written label. None of the questions are triage prototypes.
+
+Run from the project root:
+    python -m retrieval.evaluate_triage
+"""
+
+from prompt_templates import prompt_templates
+from query_gemini import query_ai
+from .main_workflow import TRIAGE_MIN_MARGIN, classify_query_locally
+
+# Hand-labelled questions, distinct from the prototypes in TRIAGE_PROTOTYPES
+LABELLED_QUESTIONS = [
+    ("What is the population of Nigeria projected to be in 2100?", "DATA_QUESTION"),
+    ("Which country has the lowest total fertility rate?", "DATA_QUESTION"),
+    ("How many countries have a population that has already peaked?", "DATA_QUESTION"),
+    ("What is the median age of the world population?", "DATA_QUESTION"),
+    ("How did COVID-19 affect life expectancy in 2021?", "DATA_QUESTION"),
+    ("What is the infant mortality rate in South Asia?", "DATA_QUESTION"),
+    ("How are census data used in the World Population Prospects?", "DATA_QUESTION"),
+    ("What share of the population will be over 65 in Europe by 2050?", "DATA_QUESTION"),
+    ("How many people live in China today?", "DATA_QUESTION"),
+    ("What is the net migration rate of Germany?", "DATA_QUESTION"),
+    ("Is the population of Japan shrinking?", "DATA_QUESTION"),
+    ("How is the uncertainty of population projections estimated?", "DATA_QUESTION"),
+    ("Who is the current president of France?", "OUT_OF_SCOPE"),
+    ("How do I reset my router?", "OUT_OF_SCOPE"),
+    ("What is the capital of Australia?", "OUT_OF_SCOPE"),
+    ("Explain how photosynthesis works.", "OUT_OF_SCOPE"),
+    ("Who won the Super Bowl last year?", "OUT_OF_SCOPE"),
+    ("Write a poem about the ocean.", "OUT_OF_SCOPE"),
+    ("What time does the Louvre open?", "OUT_OF_SCOPE"),
+    ("How do I sort a list in Python?", "OUT_OF_SCOPE"),
+    ("What are the symptoms of the flu?", "OUT_OF_SCOPE"),
+    ("Which stocks should I buy this year?", "OUT_OF_SCOPE"),
+    ("How many calories are in a banana?", "OUT_OF_SCOPE"),
+    ("What is the tallest mountain in Europe?", "OUT_OF_SCOPE"),
+]
+MARGINS = [0.0, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4]
+
+
+def main():
+    results = []
+    for question, label in LABELLED_QUESTIONS:
+        local_label, margin = classify_query_locally(question)
+        gemini_label = query_ai(
+            system_prompt=prompt_templates["triage_prompt"]["system"],
+            user_prompt=f"Evaluate user query: {question}"
+        )
+        results.append((label, local_label, margin, gemini_label))
+        print(f"{margin:.3f}  local={local_label:<13}  gemini={gemini_label:<13}  label={label:<13}  {question}")
+
+    gemini_correct = sum(gemini_label == label for label, _, _, gemini_label in results)
+    print(f"\nGemini matches the label on {gemini_correct}/{len(results)} questions")
+
+    print(f"\n=== Local triage by margin (current TRIAGE_MIN_MARGIN = {TRIAGE_MIN_MARGIN}) ===")
+    print("margin  decided locally  agrees with Gemini  matches label")
+    for min_margin in MARGINS:
+        decided = [r for r in results if r[2] >= min_margin]
+        agree = sum(local_label == gemini_label for _, local_label, _, gemini_label in decided)
+        correct = sum(local_label == label for label, local_label, _, _ in decided)
+        print(f"{min_margin:<6}  {len(decided):>3}/{len(results):<12}  {agree:>3}/{len(decided):<15}  {correct:>3}/{len(decided)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,21 +8,80 @@ This file defines the main LangGraph workflow that:
 3. Generates the final answer using an LLM.
 """
 
+import asyncio
 import sys
 sys.path.append("../")  # Allow imports from parent directory
 
 from dotenv import load_dotenv
 from typing import TypedDict
+import numpy as np
 from langgraph.graph import StateGraph, END
 from langchain.schema import Document
 from prompt_templates import prompt_templates
-from query_gemini import query_ai
-from .retrieval_workflow import retrieval_app  # Import subgraph
+from query_gemini import aquery_ai
+from .retrieval_workflow import retrieval_app, embedding_function  # Import subgraph
 
 # Load environment variables (API keys, config, etc.)
 load_dotenv()
 
 
+# -------------------
+# Local Triage Classifier
+# -------------------
+# Prototype questions for each triage label: the two examples per label from the
+# triage prompt, plus four more per label written to cover other common topics
+TRIAGE_PROTOTYPES = {
+    "DATA_QUESTION": [
+        "What is the current population growth rate in Africa?",
+        "Tell me about the latest World Population Prospects report.",
+        "What is the projected world population in 2050?",
+        "How has life expectancy changed over the last decades?",
+        "What is the fertility rate in India?",
+        "How does the United Nations estimate migration in its population projections?",
+    ],
+    "OUT_OF_SCOPE": [
+        "Who won the last World Cup?",
+        "What is the weather forecast for Paris?",
+        "How do I bake chocolate chip cookies?",
+        "What is the best programming language to learn?",
+        "Recommend me a good movie to watch tonight.",
+        "What is the price of Bitcoin today?",
+    ],
+}
+# Minimum similarity margin between labels to trust the local classifier;
+# closer calls fall back to the Gemini triage prompt. Conservative until a margin is
+# chosen from measured agreement with Gemini (`python -m retrieval.evaluate_triage`).
+TRIAGE_MIN_MARGIN = 0.3
+
+
+def embed(texts: list[str]) -> np.ndarray:
+    """
+    Embed texts and L2-normalize them, so dot products are cosine similarities.
+    """
+    # Same MiniLM embedding function instance the ChromaDB collection uses
+    vectors = np.asarray(embedding_function(texts), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+triage_prototype_vectors = {
+    label: embed(examples) for label, examples in TRIAGE_PROTOTYPES.items()
+}
+
+
+def classify_query_locally(query: str) -> tuple[str, float]:
+    """
+    Classify the query by cosine similarity to the prototype questions.
+    Returns the best label and its similarity margin over the other label.
+    """
+    query_vector = embed([query])[0]
+    similarities = {
+        label: float(np.max(vectors @ query_vector))
+        for label, vectors in triage_prototype_vectors.items()
+    }
+    best, second = sorted(similarities, key=similarities.get, reverse=True)
+    return best, similarities[best] - similarities[second]
+
+
 # -------------------
 # State Definitions
 # -------------------
@@ -45,15 +104,23 @@ class OutputState(TypedDict):
 # -------------------
 # Nodes
 # -------------------
-def triage_node(state: InputState) -> InputState:
+async def triage_node(state: InputState) -> InputState:
     """
     Classify the query into:
     - "DATA_QUESTION" if it's about demography / UN WPP
     - "OUT_OF_SCOPE" otherwise
+    Uses the local embedding classifier, and only asks Gemini
+    when the classifier is not confident.
     """
     query = state["query"]
 
-    triage_result = query_ai(
+    # Embedding runs synchronously; keep it off the event loop so concurrent queries proceed
+    label, margin = await asyncio.to_thread(classify_query_locally, query)
+    if margin >= TRIAGE_MIN_MARGIN:
+        state["query_type"] = label
+        return state
+
+    triage_result = await aquery_ai(
         system_prompt=prompt_templates["triage_prompt"]["system"],
         user_prompt=f"Evaluate user query: {query}"
     )
@@ -62,30 +129,30 @@ def triage_node(state: InputState) -> InputState:
     return state
 
 
-def out_of_scope_node(state: InputState) -> OutputState:
+async def out_of_scope_node(state: InputState) -> OutputState:
     """
     Respond to queries that are out of scope.
     """
     return {"answer": "Your query is out of scope."}
 
 
-def retrieval(state: InputState) -> InputState:
+async def retrieval(state: InputState) -> InputState:
     """
     Run the retrieval subgraph.
     This will enrich the state with 'retrieved_documents'.
     """
-    subgraph_output = retrieval_app.invoke(state)
+    subgraph_output = await retrieval_app.ainvoke(state)
     return subgraph_output
 
 
-def generate_answer_node(state: InputState) -> OutputState:
+async def generate_answer_node(state: InputState) -> OutputState:
     """
     Generate the final answer using retrieved documents and the query.
     """
     query = state["query"]
     context = "\n\n".join(doc.page_content for doc in state["retrieved_documents"])
 
-    answer_result = query_ai(
+    answer_result = await aquery_ai(
         system_prompt=prompt_templates["answer_generation_prompt"]["system"],
         user_prompt=f"Evaluate user query: {query} with context: {context}"
     )
@@ -124,5 +191,5 @@ workflow.add_edge("retrieval", "answer")
 workflow.add_edge("out_of_scope", END)
 workflow.add_edge("answer", END)
 
-# Compile the app
+# Compile the app (nodes are async: run with `ainvoke` / `abatch`)
 main_rag_app = workflow.compile()
@@ -5,20 +5,36 @@ This module defines a LangGraph sub-graph for multi-strategy document retrieval
 
 Retrieval steps:
 1. **Semantic Search** via ChromaDB vector store
-2. **BM25 Search** using lexical matching
+2. **BM25 Search** using lexical matching (runs in parallel with step 1)
 3. **CrossEncoder Reranking** to combine results and select top documents
 
 Outputs:
 - A list of top-ranked `Document` objects in `retrieved_documents`.
 """
 
-from typing import TypedDict
+import hashlib
+import os
+import platform
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, TypedDict
 from langgraph.graph import StateGraph, START, END
 from chromadb import PersistentClient
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 from langchain.schema import Document
 from langchain_community.retrievers import BM25Retriever
 from sentence_transformers import CrossEncoder
 import numpy as np
+import torch
+
+if TYPE_CHECKING:
+    # Only needed for the opt-in INT8 reranker; imported lazily where used
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import PreTrainedTokenizerBase
 
 # =============================================================================
 # --- CONFIGURATION ---
@@ -27,21 +43,272 @@ CHROMA_PATH = "chroma"                              # Path to local ChromaDB sto
 COLLECTION_NAME = "un_population_report_2024"       # Name of the ChromaDB collection
 NR_RETRIEVED_DOCS = 25                              # How many docs to fetch per method
 NR_FINAL_DOCS = 5                                   # How many docs to keep after reranking
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # CrossEncoder used for reranking
+RERANKER_ONNX_PATH = "models/ms-marco-MiniLM-L-6-v2-int8"  # Quantized ONNX export (CPU)
+# Use the INT8 ONNX reranker on CPU instead of BF16. Off until its top NR_FINAL_DOCS
+# match FP32 on representative queries (check with `python -m retrieval.compare_rerankers`).
+RERANKER_INT8_ON_CPU = False
+RERANK_MAX_LENGTH = 512                             # Max tokens per (query, doc) pair
+RERANK_BATCH_SIZE = 64                              # Pairs per CrossEncoder forward pass
+SCORE_CACHE_SIZE = 100_000                          # Max cached (query, doc) CrossEncoder scores
+BM25_FETCH_PAGE_SIZE = 10_000                       # Docs fetched per page when building BM25
+SCORE_KEYS = ("vector_score", "bm25_score", "colbert_score", "context_score")
 
 # =============================================================================
 # --- INITIALIZATION ---
 # =============================================================================
-# ChromaDB client & collection
+# ChromaDB client & collection. The embedding function is passed explicitly
+# so other modules can reuse the same loaded model (e.g. for triage).
 chroma_client = PersistentClient(path=CHROMA_PATH)
-collection = chroma_client.get_collection(COLLECTION_NAME)
+embedding_function = DefaultEmbeddingFunction()
+collection = chroma_client.get_collection(COLLECTION_NAME, embedding_function=embedding_function)
+
+# =============================================================================
+# --- RERANKER MODEL ---
+# =============================================================================
+def select_quantization_config() -> "AutoQuantizationConfig":
+    """
+    Pick the dynamic INT8 quantization config matching the host CPU:
+    arm64 on ARM, otherwise the widest x86 instruction set available.
+    """
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+
+    cpu_flags = set()
+    cpuinfo = Path("/proc/cpuinfo")
+    if cpuinfo.exists():
+        for line in cpuinfo.read_text().splitlines():
+            if line.startswith("flags"):
+                cpu_flags = set(line.split(":", 1)[1].split())
+                break
+
+    if "avx512_vnni" in cpu_flags:
+        return AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    if "avx512f" in cpu_flags:
+        return AutoQuantizationConfig.avx512(is_static=False, per_channel=False)
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+
+def load_quantized_reranker() -> tuple["ORTModelForSequenceClassification", "PreTrainedTokenizerBase"]:
+    """
+    Load the CrossEncoder as a dynamically INT8-quantized ONNX Runtime model.
+    On first use the model is exported to ONNX, quantized and saved to
+    RERANKER_ONNX_PATH; later runs load the saved model directly.
+    The export is written to a temporary directory and moved into place only
+    once complete, so a failed export is retried on the next start.
+    """
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+    from transformers import AutoTokenizer
+
+    onnx_path = Path(RERANKER_ONNX_PATH)
+    required_files = ("model_quantized.onnx", "config.json", "tokenizer_config.json")
+    if not all((onnx_path / name).exists() for name in required_files):
+        print(f"[INFO] Exporting and quantizing {RERANKER_MODEL} to {onnx_path}")
+        onnx_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(dir=onnx_path.parent, prefix=f"{onnx_path.name}.tmp-"))
+        try:
+            model = ORTModelForSequenceClassification.from_pretrained(RERANKER_MODEL, export=True)
+            quantizer = ORTQuantizer.from_pretrained(model)
+            quantizer.quantize(save_dir=tmp_path, quantization_config=select_quantization_config())
+            AutoTokenizer.from_pretrained(RERANKER_MODEL).save_pretrained(tmp_path)
+            shutil.rmtree(onnx_path, ignore_errors=True)  # Leftover incomplete export
+            tmp_path.rename(onnx_path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    model = ORTModelForSequenceClassification.from_pretrained(onnx_path, file_name="model_quantized.onnx")
+    tokenizer = AutoTokenizer.from_pretrained(onnx_path)
+    return model, tokenizer
+
+
+# Serializes tokenizer and model use across concurrent queries: the fast tokenizer
+# is not safe to call from several threads ("Already borrowed"), and each forward
+# pass already uses every intra-op thread
+reranker_lock = threading.Lock()
+
+# CrossEncoder model for reranking: FP16 on GPU; on CPU BF16, or INT8 ONNX Runtime if enabled
+if torch.cuda.is_available():
+    cross_encoder = CrossEncoder(
+        RERANKER_MODEL,
+        device="cuda",
+        automodel_args={"torch_dtype": torch.float16}
+    )
+    reranker_model, reranker_tokenizer = cross_encoder.model, cross_encoder.tokenizer
+elif RERANKER_INT8_ON_CPU:
+    reranker_model, reranker_tokenizer = load_quantized_reranker()
+else:
+    torch.set_num_threads(os.cpu_count() or 1)
+    cross_encoder = CrossEncoder(
+        RERANKER_MODEL,
+        device="cpu",
+        automodel_args={"torch_dtype": torch.bfloat16}
+    )
+    reranker_model, reranker_tokenizer = cross_encoder.model, cross_encoder.tokenizer
+
+# =============================================================================
+# --- BM25 INDEX ---
+# =============================================================================
+def build_bm25_retriever() -> Optional[BM25Retriever]:
+    """
+    Build a BM25 retriever over all documents currently stored in ChromaDB.
+    Documents are fetched in pages so large collections are not loaded in one call.
+    Returns None if the collection is empty, as BM25 cannot index zero documents.
+    """
+    all_docs = []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas"],
+            limit=BM25_FETCH_PAGE_SIZE,
+            offset=offset
+        )
+        all_docs.extend(
+            Document(page_content=doc, metadata=meta or {})
+            for doc, meta in zip(page["documents"], page["metadatas"])
+        )
+        if len(page["ids"]) < BM25_FETCH_PAGE_SIZE:
+            break
+        offset += BM25_FETCH_PAGE_SIZE
+
+    if not all_docs:
+        return None
+
+    retriever = BM25Retriever.from_documents(all_docs)
+    retriever.k = NR_RETRIEVED_DOCS
+    return retriever
+
 
-# CrossEncoder model for reranking
-reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+# BM25 index built once at startup and rebuilt only when the collection size changes.
+# If the startup build fails, the count stays None so the first query retries it.
+bm25_snapshot = {"count": None, "retriever": None}
+bm25_snapshot_lock = threading.Lock()
+try:
+    bm25_snapshot.update(count=collection.count(), retriever=build_bm25_retriever())
+except Exception as e:
+    print(f"[ERROR] Building BM25 index failed: {e}")
+
+
+def get_bm25_retriever() -> Optional[BM25Retriever]:
+    """
+    Return the cached BM25 retriever, rebuilding it if documents were
+    added to or removed from ChromaDB since it was built.
+    Returns None if the collection is empty.
+    """
+    count = collection.count()
+    with bm25_snapshot_lock:
+        if count != bm25_snapshot["count"]:
+            print(f"[INFO] Collection size changed ({bm25_snapshot['count']} -> {count}), rebuilding BM25 index")
+            bm25_snapshot["retriever"] = build_bm25_retriever()
+            bm25_snapshot["count"] = count
+        return bm25_snapshot["retriever"]
+
+# =============================================================================
+# --- RERANKING ---
+# =============================================================================
+# LRU cache of CrossEncoder scores keyed by (query hash, document hash)
+score_cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+score_cache_lock = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    """
+    Return the SHA-1 hex digest of the text, used as a score cache key.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def score_pairs(query: str, doc_texts: list[str]) -> np.ndarray:
+    """
+    Score (query, document) pairs, reusing cached scores where available.
+    Only pairs missing from the cache are sent to the CrossEncoder.
+    """
+    query_hash = text_hash(query)
+    keys = [(query_hash, text_hash(doc_text)) for doc_text in doc_texts]
+
+    scores = np.empty(len(doc_texts), dtype=np.float32)
+    misses = []
+    with score_cache_lock:
+        for i, key in enumerate(keys):
+            if key in score_cache:
+                score_cache.move_to_end(key)
+                scores[i] = score_cache[key]
+            else:
+                misses.append(i)
+
+    if not misses:
+        return scores
+
+    miss_scores = predict_scores(query, [doc_texts[i] for i in misses])
+    scores[misses] = miss_scores
+
+    with score_cache_lock:
+        for i, score in zip(misses, miss_scores):
+            score_cache[keys[i]] = float(score)
+        while len(score_cache) > SCORE_CACHE_SIZE:
+            score_cache.popitem(last=False)
+
+    return scores
+
+
+def predict_scores(query: str, doc_texts: list[str], model=None, tokenizer=None) -> np.ndarray:
+    """
+    Score (query, document) pairs with the CrossEncoder in batches of RERANK_BATCH_SIZE.
+    Tokenizes each batch at once and calls the underlying model directly,
+    bypassing the per-pair overhead of `CrossEncoder.predict`.
+    `model` and `tokenizer` default to the configured reranker.
+    Returns raw relevance logits (higher is more relevant).
+    """
+    model = model or reranker_model
+    tokenizer = tokenizer or reranker_tokenizer
+    scores = []
+    with reranker_lock:
+        for start in range(0, len(doc_texts), RERANK_BATCH_SIZE):
+            batch = doc_texts[start:start + RERANK_BATCH_SIZE]
+            inputs = tokenizer(
+                [query] * len(batch),
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=RERANK_MAX_LENGTH,
+                return_tensors="pt"
+            ).to(model.device)
+
+            with torch.inference_mode():
+                logits = model(**inputs).logits
+
+            # Cast to float32 numpy, as numpy has no bfloat16
+            scores.append(logits.squeeze(-1).float().cpu().numpy())
+
+    return np.concatenate(scores)
+
+
+def deduplicate_docs(docs: list[Document]) -> list[Document]:
+    """
+    Drop documents with identical content, so each is scored only once.
+    Metadata of duplicates is merged: retrieval methods are combined
+    and the highest of each retrieval score is kept.
+    """
+    unique: dict[str, Document] = {}
+    for doc in docs:
+        kept = unique.setdefault(doc.page_content, doc)
+        if kept is doc:
+            continue
+
+        for key in SCORE_KEYS:
+            kept.metadata[key] = max(kept.metadata.get(key, 0.0), doc.metadata.get(key, 0.0))
+
+        methods = kept.metadata["retrieval_method"].split("+")
+        if doc.metadata["retrieval_method"] not in methods:
+            kept.metadata["retrieval_method"] = "+".join(methods + [doc.metadata["retrieval_method"]])
+
+    return list(unique.values())
 
 # =============================================================================
 # --- STATE DEFINITIONS ---
 # =============================================================================
-class RetrievalInputState(TypedDict):
+class RetrievalInputState(TypedDict, total=False):
     query: str
     semantic_docs: list[Document]
     bm25_docs: list[Document]
@@ -57,7 +324,7 @@ class RetrievalOutputState(TypedDict):
 def semantic_search_node(state: RetrievalInputState) -> RetrievalInputState:
     """
     Perform semantic search using the ChromaDB vector store.
-    Stores results in state["semantic_docs"].
+    Returns results as an update to state["semantic_docs"].
     """
     results = collection.query(
         query_texts=[state["query"]],
@@ -83,27 +350,19 @@ def semantic_search_node(state: RetrievalInputState) -> RetrievalInputState:
             }
         ))
 
-    state["semantic_docs"] = docs
-    return state
+    # Return only the updated key, as this node runs in parallel with BM25 search
+    return {"semantic_docs": docs}
 
 
 def bm25_search_node(state: RetrievalInputState) -> RetrievalInputState:
     """
     Perform BM25 lexical search across all documents in ChromaDB.
-    Stores results in state["bm25_docs"].
+    Returns results as an update to state["bm25_docs"].
     """
     try:
-        # Fetch all documents from Chroma
-        all_results = collection.get(include=["documents", "metadatas"])
-        all_docs = [
-            Document(page_content=doc, metadata=meta or {})
-            for doc, meta in zip(all_results["documents"], all_results["metadatas"])
-        ]
-
-        # Run BM25 retrieval
-        bm25_retriever = BM25Retriever.from_documents(all_docs)
-        bm25_retriever.k = NR_RETRIEVED_DOCS
-        results = bm25_retriever.invoke(state["query"])
+        # Run BM25 retrieval against the prebuilt index (none for an empty collection)
+        bm25_retriever = get_bm25_retriever()
+        results = bm25_retriever.invoke(state["query"]) if bm25_retriever else []
 
         docs = []
         for i, doc in enumerate(results):
@@ -121,13 +380,12 @@ def bm25_search_node(state: RetrievalInputState) -> RetrievalInputState:
                 }
             ))
 
-        state["bm25_docs"] = docs
-
     except Exception as e:
         print(f"[ERROR] BM25 retrieval failed: {e}")
-        state["bm25_docs"] = []
+        docs = []
 
-    return state
+    # Return only the updated key, as this node runs in parallel with semantic search
+    return {"bm25_docs": docs}
 
 
 def merge_and_rerank_node(state: RetrievalInputState) -> RetrievalOutputState:
@@ -135,37 +393,30 @@ def merge_and_rerank_node(state: RetrievalInputState) -> RetrievalOutputState:
     Merge semantic and BM25 results, rerank using CrossEncoder,
     and return top NR_FINAL_DOCS in `retrieved_documents`.
     """
-    all_docs = state["semantic_docs"] + state["bm25_docs"]
+    # Semantic and BM25 results often overlap; score each document once
+    all_docs = deduplicate_docs(state["semantic_docs"] + state["bm25_docs"])
     if not all_docs:
         return {"query": state["query"], "retrieved_documents": []}
 
-    # Prepare query document pairs for CrossEncoder
+    # Prepare document texts for CrossEncoder
     doc_texts = [doc.page_content for doc in all_docs]
-    pairs = [(state["query"], doc_text) for doc_text in doc_texts]
 
     # Get CrossEncoder scores
-    scores = np.array(reranker.predict(pairs))
-
-    # Normalize scores to 0 1 range
-    normalized_scores = (
-        (scores - scores.min()) / (scores.max() - scores.min() + 1e-6)
-        if scores.max() > scores.min()
-        else np.ones_like(scores) * 0.5
-    )
-
-    # Store scores in metadata
-    for i, doc in enumerate(all_docs):
-        doc.metadata["crossencoder_score"] = float(normalized_scores[i])
+    scores = score_pairs(state["query"], doc_texts)
 
-    # Sort documents by raw CrossEncoder score (not normalized)
-    sorted_docs = [
-        doc for _, doc in sorted(zip(scores, all_docs),
-                                 key=lambda x: x[0],
-                                 reverse=True)
-    ]
+    # Select the top NR_FINAL_DOCS indices by raw CrossEncoder score,
+    # then sort only those
+    if len(scores) > NR_FINAL_DOCS:
+        top_idx = np.argpartition(-scores, NR_FINAL_DOCS)[:NR_FINAL_DOCS]
+    else:
+        top_idx = np.arange(len(scores))
+    top_idx = top_idx[np.argsort(-scores[top_idx])]
 
-    # Take top documents
-    top_docs = sorted_docs[:NR_FINAL_DOCS]
+    # Take top documents, recording their score in metadata
+    top_docs = []
+    for i in top_idx:
+        all_docs[i].metadata["crossencoder_score"] = float(scores[i])
+        top_docs.append(all_docs[i])
 
     return {"query": state["query"], "retrieved_documents": top_docs}
 
@@ -177,9 +428,10 @@ retrieval_graph.add_node("semantic_search", semantic_search_node)
 retrieval_graph.add_node("bm25_search", bm25_search_node)
 retrieval_graph.add_node("merge_and_rerank", merge_and_rerank_node)
 
+# Both searches start together and run concurrently; reranking waits for both
 retrieval_graph.add_edge(START, "semantic_search")
-retrieval_graph.add_edge("semantic_search", "bm25_search")
-retrieval_graph.add_edge("bm25_search", "merge_and_rerank")
+retrieval_graph.add_edge(START, "bm25_search")
+retrieval_graph.add_edge(["semantic_search", "bm25_search"], "merge_and_rerank")
 retrieval_graph.add_edge("merge_and_rerank", END)
 
 # Compiled retrieval pipeline